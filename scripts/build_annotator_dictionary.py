@@ -4,23 +4,63 @@ Build OpenCRAVAT Annotator Dictionary
 Creates a comprehensive JSON dictionary of all available annotators for Claude API
 """
 
+import argparse
 import os
+import re
 import yaml
 import json
-from pathlib import Path
+from multiprocessing import Pool
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 MODULES_DIR = "/apps/opencravat_modules/annotators"
+CACHE_PATH = "/home/ubuntu/genobank-cli/.annotator_metadata_cache.json"
+# Bump whenever extract_annotator_metadata changes what it produces
+CACHE_VERSION = 1
+# Below this many stale YAMLs, parse serially rather than start a process pool
+MIN_PARALLEL_PARSE = 8
+
+# Category rules: (category, tag triggers, name keywords, require both tag and name match)
+CATEGORY_RULES = [
+    ("clinical_significance", ["clinical_relevance", "mendelian_disease", "variants"], ["clinvar", "omim", "acmg"], True),
+    ("cancer", ["cancer"], ["cosmic", "oncokb"], False),
+    ("population_frequency", ["allele_frequency"], ["gnomad", "exac", "esp", "1000g", "thousandgenomes"], False),
+    ("variant_effect_prediction", ["variant_effect_prediction"], ["sift", "polyphen", "cadd", "revel", "vest", "chasm", "alpha"], False),
+    ("pharmacogenomics", ["drugs"], ["pharmgkb", "dgi"], False),
+    ("mendelian_disease", ["mendelian_disease"], ["omim", "hpo"], False),
+    ("splicing", [], ["splice", "dbscsnv"], False),
+    ("regulatory", ["regulation", "regulatory"], ["encode", "regulome", "enhancer"], False),
+    ("conservation", [], ["gerp", "phylop", "phastcons", "siphy"], False),
+    ("pathways", ["pathways"], ["kegg", "reactome", "biogrid", "intact"], False),
+    ("protein_function", [], ["uniprot", "pfam", "interpro", "swissprot"], False),
+]
+
+# Tag triggers as sets and name keywords compiled once into a single alternation
+# per category; None for tag-only rules, since an empty pattern matches every name
+COMPILED_CATEGORY_RULES = [
+    (category, frozenset(tag_triggers),
+     re.compile("|".join(map(re.escape, name_keywords))) if name_keywords else None,
+     require_both)
+    for category, tag_triggers, name_keywords, require_both in CATEGORY_RULES
+]
 
 def extract_annotator_metadata(annotator_name):
     """Extract metadata from annotator YAML file"""
-    yml_path = Path(MODULES_DIR) / annotator_name / f"{annotator_name}.yml"
-
-    if not yml_path.exists():
-        return None
+    yml_path = f"{MODULES_DIR}/{annotator_name}/{annotator_name}.yml"
 
     try:
-        with open(yml_path, 'r') as f:
-            data = yaml.safe_load(f)
+        with open(yml_path, 'rb') as f:
+            data = yaml.load(f.read(), Loader=SafeLoader)
+
+        dev = data.get("developer") or {}
 
         # Extract key metadata
         metadata = {
@@ -30,254 +70,315 @@ def extract_annotator_metadata(annotator_name):
             "tags": data.get("tags", []),
             "level": data.get("level", "variant"),
             "version": data.get("version", ""),
-            "developer": data.get("developer", {}).get("organization", ""),
-            "citation": data.get("developer", {}).get("citation", ""),
-            "website": data.get("developer", {}).get("website", "")
+            "developer": dev.get("organization", ""),
+            "citation": dev.get("citation", ""),
+            "website": dev.get("website", "")
         }
 
         return metadata
+    except FileNotFoundError:
+        return None
     except Exception as e:
         print(f"Error processing {annotator_name}: {e}")
         return None
 
+# Shared string values (level, developer, tags, ...) repeated across annotators
+INTERNED_FIELDS = ("level", "version", "developer", "citation", "website")
+_intern = {}
+
+def intern_metadata(metadata):
+    """Make repeated string values across annotators share one object"""
+    for field in INTERNED_FIELDS:
+        value = metadata.get(field)
+        if isinstance(value, str):
+            metadata[field] = _intern.setdefault(value, value)
+    tags = metadata.get("tags")
+    if isinstance(tags, list):
+        metadata["tags"] = [_intern.setdefault(t, t) if isinstance(t, str) else t for t in tags]
+    return metadata
+
+def load_metadata_cache():
+    """Load cached annotator metadata keyed by name -> [mtime, metadata]"""
+    try:
+        with open(CACHE_PATH, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache.get("entries", {})
+
+def save_metadata_cache(entries):
+    """Persist annotator metadata cache"""
+    # Encode entries one by one so a single unserializable value (e.g. a YAML
+    # date) only drops that annotator, and encode before opening so a failure
+    # can't truncate the file
+    encoded = []
+    skipped = []
+    for name, entry in entries.items():
+        try:
+            encoded.append(f"{json.dumps(name)}: {json.dumps(entry)}")
+        except (TypeError, ValueError):
+            skipped.append(name)
+
+    if skipped:
+        print(f"Not caching {len(skipped)} annotators with non-JSON values: {', '.join(skipped)}")
+
+    payload = f'{{"version": {CACHE_VERSION}, "entries": {{{", ".join(encoded)}}}}}'
+    try:
+        with open(CACHE_PATH, 'w') as f:
+            f.write(payload)
+    except OSError as e:
+        print(f"Could not write metadata cache: {e}")
+
 def categorize_by_tags(annotators):
     """Categorize annotators by their tags"""
-    categories = {
-        "clinical_significance": [],
-        "cancer": [],
-        "population_frequency": [],
-        "variant_effect_prediction": [],
-        "pharmacogenomics": [],
-        "mendelian_disease": [],
-        "splicing": [],
-        "regulatory": [],
-        "conservation": [],
-        "pathways": [],
-        "protein_function": [],
-        "other": []
-    }
+    categories = {category: [] for category, _, _, _ in CATEGORY_RULES}
+    categories["other"] = []
 
     for ann in annotators:
-        tags = [t.lower().replace(" ", "_") for t in ann.get("tags", [])]
+        tag_set = {t.lower().replace(" ", "_") for t in ann.get("tags", [])}
+        name = ann["name"]
 
         categorized = False
-
-        # Clinical significance
-        if any(t in tags for t in ["clinical_relevance", "mendelian_disease", "variants"]):
-            if "clinvar" in ann["name"] or "omim" in ann["name"] or "acmg" in ann["name"]:
-                categories["clinical_significance"].append(ann)
+        for category, tag_triggers, name_pattern, require_both in COMPILED_CATEGORY_RULES:
+            tag_match = not tag_set.isdisjoint(tag_triggers)
+            name_match = name_pattern is not None and name_pattern.search(name)
+            if require_both:
+                matched = tag_match and name_match
+            else:
+                matched = tag_match or name_match
+
+            if matched:
+                categories[category].append(ann)
                 categorized = True
 
-        # Cancer
-        if "cancer" in tags or "cosmic" in ann["name"] or "oncokb" in ann["name"]:
-            categories["cancer"].append(ann)
-            categorized = True
-
-        # Population frequency
-        if "allele_frequency" in tags or any(x in ann["name"] for x in ["gnomad", "exac", "esp", "1000g", "thousandgenomes"]):
-            categories["population_frequency"].append(ann)
-            categorized = True
-
-        # Variant effect prediction
-        if "variant_effect_prediction" in tags or any(x in ann["name"] for x in ["sift", "polyphen", "cadd", "revel", "vest", "chasm", "alpha"]):
-            categories["variant_effect_prediction"].append(ann)
-            categorized = True
-
-        # Pharmacogenomics
-        if "drugs" in tags or "pharmgkb" in ann["name"] or "dgi" in ann["name"]:
-            categories["pharmacogenomics"].append(ann)
-            categorized = True
-
-        # Mendelian disease
-        if "mendelian_disease" in tags or "omim" in ann["name"] or "hpo" in ann["name"]:
-            categories["mendelian_disease"].append(ann)
-            categorized = True
-
-        # Splicing
-        if any(x in ann["name"] for x in ["splice", "dbscsnv"]):
-            categories["splicing"].append(ann)
-            categorized = True
-
-        # Regulatory
-        if any(x in tags for x in ["regulation", "regulatory"]) or any(x in ann["name"] for x in ["encode", "regulome", "enhancer"]):
-            categories["regulatory"].append(ann)
-            categorized = True
-
-        # Conservation
-        if any(x in ann["name"] for x in ["gerp", "phylop", "phastcons", "siphy"]):
-            categories["conservation"].append(ann)
-            categorized = True
-
-        # Pathways
-        if "pathways" in tags or any(x in ann["name"] for x in ["kegg", "reactome", "biogrid", "intact"]):
-            categories["pathways"].append(ann)
-            categorized = True
-
-        # Protein function
-        if any(x in ann["name"] for x in ["uniprot", "pfam", "interpro", "swissprot"]):
-            categories["protein_function"].append(ann)
-            categorized = True
-
         if not categorized:
             categories["other"].append(ann)
 
     return categories
 
-def build_recommendations():
-    """Build recommendation rules for Claude API"""
-    recommendations = {
-        "phenotypes": {
-            "cancer": {
-                "description": "Cancer-related analysis",
-                "recommended_annotators": [
-                    "clinvar",
-                    "cosmic",
-                    "cancer_genome_interpreter",
-                    "cancer_hotspots",
-                    "civic",
-                    "oncokb",
-                    "chasmplus",
-                    "gnomad",
-                    "alphamissense",
-                    "revel"
-                ]
-            },
-            "cardiovascular": {
-                "description": "Cardiovascular disease analysis",
-                "recommended_annotators": [
-                    "clinvar",
-                    "cardioboost",
-                    "cvdkp",
-                    "gnomad",
-                    "alphamissense",
-                    "sift",
-                    "polyphen2"
-                ]
-            },
-            "hereditary_cancer": {
-                "description": "Hereditary cancer predisposition",
-                "recommended_annotators": [
-                    "clinvar",
-                    "brca1_func_assay",
-                    "cgc",
-                    "cosmic",
-                    "gnomad",
-                    "alphamissense",
-                    "revel"
-                ]
-            },
-            "rare_disease": {
-                "description": "Rare Mendelian disease",
-                "recommended_annotators": [
-                    "clinvar",
-                    "clinvar_acmg",
-                    "omim",
-                    "hpo",
-                    "gnomad",
-                    "alphamissense",
-                    "cadd",
-                    "sift",
-                    "polyphen2",
-                    "spliceai"
-                ]
-            },
-            "pharmacogenomics": {
-                "description": "Drug response prediction",
-                "recommended_annotators": [
-                    "pharmgkb",
-                    "dgi",
-                    "clinvar",
-                    "gnomad"
-                ]
-            },
-            "autism": {
-                "description": "Autism spectrum disorder",
-                "recommended_annotators": [
-                    "clinvar",
-                    "omim",
-                    "hpo",
-                    "gnomad",
-                    "denovo",
-                    "alphamissense",
-                    "cadd"
-                ]
-            },
-            "developmental_delay": {
-                "description": "Developmental delay and intellectual disability",
-                "recommended_annotators": [
-                    "clinvar",
-                    "omim",
-                    "hpo",
-                    "gnomad",
-                    "denovo",
-                    "alphamissense",
-                    "spliceai"
-                ]
-            }
+# Recommendation rules for Claude API
+RECOMMENDATIONS = {
+    "phenotypes": {
+        "cancer": {
+            "description": "Cancer-related analysis",
+            "recommended_annotators": [
+                "clinvar",
+                "cosmic",
+                "cancer_genome_interpreter",
+                "cancer_hotspots",
+                "civic",
+                "oncokb",
+                "chasmplus",
+                "gnomad",
+                "alphamissense",
+                "revel"
+            ]
         },
-        "analysis_types": {
-            "rare_coding": {
-                "description": "Rare coding variant analysis",
-                "recommended_annotators": [
-                    "clinvar",
-                    "gnomad",
-                    "alphamissense",
-                    "revel",
-                    "cadd",
-                    "sift",
-                    "polyphen2",
-                    "vest"
-                ]
-            },
-            "splicing": {
-                "description": "Splicing variant analysis",
-                "recommended_annotators": [
-                    "clinvar",
-                    "spliceai",
-                    "dbscsnv",
-                    "gnomad"
-                ]
-            },
-            "regulatory": {
-                "description": "Regulatory variant analysis",
-                "recommended_annotators": [
-                    "encode_tfbs",
-                    "ensembl_regulatory_build",
-                    "regulomedb",
-                    "vista_enhancer",
-                    "gnomad"
-                ]
-            },
-            "de_novo": {
-                "description": "De novo variant analysis",
-                "recommended_annotators": [
-                    "clinvar",
-                    "denovo",
-                    "gnomad",
-                    "alphamissense",
-                    "cadd"
-                ]
-            }
+        "cardiovascular": {
+            "description": "Cardiovascular disease analysis",
+            "recommended_annotators": [
+                "clinvar",
+                "cardioboost",
+                "cvdkp",
+                "gnomad",
+                "alphamissense",
+                "sift",
+                "polyphen2"
+            ]
+        },
+        "hereditary_cancer": {
+            "description": "Hereditary cancer predisposition",
+            "recommended_annotators": [
+                "clinvar",
+                "brca1_func_assay",
+                "cgc",
+                "cosmic",
+                "gnomad",
+                "alphamissense",
+                "revel"
+            ]
+        },
+        "rare_disease": {
+            "description": "Rare Mendelian disease",
+            "recommended_annotators": [
+                "clinvar",
+                "clinvar_acmg",
+                "omim",
+                "hpo",
+                "gnomad",
+                "alphamissense",
+                "cadd",
+                "sift",
+                "polyphen2",
+                "spliceai"
+            ]
+        },
+        "pharmacogenomics": {
+            "description": "Drug response prediction",
+            "recommended_annotators": [
+                "pharmgkb",
+                "dgi",
+                "clinvar",
+                "gnomad"
+            ]
+        },
+        "autism": {
+            "description": "Autism spectrum disorder",
+            "recommended_annotators": [
+                "clinvar",
+                "omim",
+                "hpo",
+                "gnomad",
+                "denovo",
+                "alphamissense",
+                "cadd"
+            ]
+        },
+        "developmental_delay": {
+            "description": "Developmental delay and intellectual disability",
+            "recommended_annotators": [
+                "clinvar",
+                "omim",
+                "hpo",
+                "gnomad",
+                "denovo",
+                "alphamissense",
+                "spliceai"
+            ]
+        }
+    },
+    "analysis_types": {
+        "rare_coding": {
+            "description": "Rare coding variant analysis",
+            "recommended_annotators": [
+                "clinvar",
+                "gnomad",
+                "alphamissense",
+                "revel",
+                "cadd",
+                "sift",
+                "polyphen2",
+                "vest"
+            ]
+        },
+        "splicing": {
+            "description": "Splicing variant analysis",
+            "recommended_annotators": [
+                "clinvar",
+                "spliceai",
+                "dbscsnv",
+                "gnomad"
+            ]
+        },
+        "regulatory": {
+            "description": "Regulatory variant analysis",
+            "recommended_annotators": [
+                "encode_tfbs",
+                "ensembl_regulatory_build",
+                "regulomedb",
+                "vista_enhancer",
+                "gnomad"
+            ]
+        },
+        "de_novo": {
+            "description": "De novo variant analysis",
+            "recommended_annotators": [
+                "clinvar",
+                "denovo",
+                "gnomad",
+                "alphamissense",
+                "cadd"
+            ]
         }
     }
+}
+
+# Every name substring the categorization rules and recommendations refer to
+RELEVANT_KEYWORDS = sorted(
+    {keyword for _, _, name_keywords, _ in CATEGORY_RULES for keyword in name_keywords}
+    | {name for section in RECOMMENDATIONS.values() for info in section.values()
+       for name in info["recommended_annotators"]}
+)
+RELEVANT_NAME_RE = re.compile("|".join(map(re.escape, RELEVANT_KEYWORDS)))
+
+def stub_annotator_metadata(annotator_name):
+    """Minimal metadata for an annotator whose YAML was not parsed"""
+    return {
+        "name": annotator_name,
+        "stub": True,
+        "title": annotator_name,
+        "description": "",
+        "tags": [],
+        "level": "variant",
+        "version": "",
+        "developer": "",
+        "citation": "",
+        "website": ""
+    }
 
-    return recommendations
+def build_recommendations():
+    """Build recommendation rules for Claude API"""
+    return RECOMMENDATIONS
 
-def main():
+def main(relevant_only=False):
     # Get all annotators
-    annotator_dirs = [d for d in os.listdir(MODULES_DIR)
-                     if os.path.isdir(os.path.join(MODULES_DIR, d))]
+    with os.scandir(MODULES_DIR) as it:
+        annotator_dirs = sorted(e.name for e in it if e.is_dir())
 
     print(f"Found {len(annotator_dirs)} annotators")
 
-    # Extract metadata
+    # Extract metadata, reusing cached entries whose YAML is unchanged
+    cache = load_metadata_cache()
+    mtimes = {}
+    extracted = {}
+    stale = []
+    stubbed = set()
+    for name in annotator_dirs:
+        yml_path = f"{MODULES_DIR}/{name}/{name}.yml"
+        try:
+            mtimes[name] = os.stat(yml_path).st_mtime
+        except OSError:
+            continue
+
+        cached = cache.get(name)
+        if cached and cached[0] == mtimes[name]:
+            extracted[name] = cached[1]
+        elif relevant_only and not RELEVANT_NAME_RE.search(name):
+            stubbed.add(name)
+        else:
+            stale.append(name)
+
+    cache_hits = len(extracted)
+
+    # Parse changed YAMLs in parallel; each annotator file is independent.
+    # A handful of stale files is cheaper to parse than to start a pool for.
+    workers = min(len(stale), os.cpu_count() or 1)
+    if len(stale) < MIN_PARALLEL_PARSE or workers < 2:
+        extracted.update((name, extract_annotator_metadata(name)) for name in stale)
+    else:
+        with Pool(workers) as pool:
+            extracted.update(zip(stale, pool.map(extract_annotator_metadata, stale)))
+
+    new_cache = {}
     annotators = []
-    for name in sorted(annotator_dirs):
-        metadata = extract_annotator_metadata(name)
+    for name in annotator_dirs:
+        if name in stubbed:
+            annotators.append(stub_annotator_metadata(name))
+            continue
+
+        metadata = extracted.get(name)
         if metadata:
+            intern_metadata(metadata)
+            new_cache[name] = [mtimes[name], metadata]
             annotators.append(metadata)
 
-    print(f"Successfully parsed {len(annotators)} annotators")
+    save_metadata_cache(new_cache)
+
+    print(f"Loaded {len(annotators) - len(stubbed)} annotators "
+          f"({cache_hits} from cache, {len(stubbed)} stubbed)")
 
     # Categorize
     categories = categorize_by_tags(annotators)
@@ -289,7 +390,8 @@ def main():
     categories_names = {k: [a["name"] for a in v] for k, v in categories.items()}
     dictionary = {
         "version": "1.0.0",
-        "total_annotators": len(annotators),
+        # Stubs were never validated as YAML, so they don't count as annotators
+        "total_annotators": len(annotators) - len(stubbed),
         "last_updated": "2025-10-07",
         "annotators": annotators,
         "categories": categories_names,
@@ -298,8 +400,14 @@ def main():
 
     # Save to JSON
     output_path = "/home/ubuntu/genobank-cli/opencravat_annotators_dictionary.json"
-    with open(output_path, 'w') as f:
-        json.dump(dictionary, f, indent=2)
+    # json.dump streams through iterencode; ensure_ascii=False keeps its bytes
+    # identical to orjson's UTF-8 output
+    if orjson is not None:
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(dictionary, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(dictionary, f, indent=2, ensure_ascii=False)
 
     print(f"\n✅ Dictionary saved to: {output_path}")
     print(f"\nCategory breakdown:")
@@ -312,42 +420,51 @@ def main():
 def create_markdown_reference(dictionary, categories):
     """Create a markdown quick reference"""
     md_path = "/home/ubuntu/genobank-cli/OPENCRAVAT_ANNOTATORS_REFERENCE.md"
+    by_name = {a['name']: a for a in dictionary['annotators']}
+
+    parts = []
+    parts.append("# OpenCRAVAT Annotators Quick Reference\n\n")
+    parts.append(f"**Total Annotators**: {dictionary['total_annotators']}\n")
+    parts.append(f"**Last Updated**: {dictionary['last_updated']}\n\n")
+
+    parts.append("## Categories\n\n")
+    for category, annotator_names in categories.items():
+        if annotator_names:
+            parts.append(f"### {category.replace('_', ' ').title()} ({len(annotator_names)})\n\n")
+            for name in sorted(annotator_names):
+                ann = by_name.get(name)
+                if ann:
+                    parts.append(f"- **{ann['title']}** (`{ann['name']}`): {ann['description'][:100]}...\n")
+            parts.append("\n")
+
+    parts.append("## Phenotype-Based Recommendations\n\n")
+    for phenotype, info in dictionary['recommendations']['phenotypes'].items():
+        parts.append(f"### {phenotype.replace('_', ' ').title()}\n")
+        parts.append(f"{info['description']}\n\n")
+        parts.append("**Recommended annotators**:\n")
+        for ann_name in info['recommended_annotators']:
+            parts.append(f"- `{ann_name}`\n")
+        parts.append("\n")
+
+    parts.append("## Analysis Type Recommendations\n\n")
+    for analysis_type, info in dictionary['recommendations']['analysis_types'].items():
+        parts.append(f"### {analysis_type.replace('_', ' ').title()}\n")
+        parts.append(f"{info['description']}\n\n")
+        parts.append("**Recommended annotators**:\n")
+        for ann_name in info['recommended_annotators']:
+            parts.append(f"- `{ann_name}`\n")
+        parts.append("\n")
 
     with open(md_path, 'w') as f:
-        f.write("# OpenCRAVAT Annotators Quick Reference\n\n")
-        f.write(f"**Total Annotators**: {dictionary['total_annotators']}\n")
-        f.write(f"**Last Updated**: {dictionary['last_updated']}\n\n")
-
-        f.write("## Categories\n\n")
-        for category, annotator_names in categories.items():
-            if annotator_names:
-                f.write(f"### {category.replace('_', ' ').title()} ({len(annotator_names)})\n\n")
-                for name in sorted(annotator_names):
-                    ann = next((a for a in dictionary['annotators'] if a['name'] == name), None)
-                    if ann:
-                        f.write(f"- **{ann['title']}** (`{ann['name']}`): {ann['description'][:100]}...\n")
-                f.write("\n")
-
-        f.write("## Phenotype-Based Recommendations\n\n")
-        for phenotype, info in dictionary['recommendations']['phenotypes'].items():
-            f.write(f"### {phenotype.replace('_', ' ').title()}\n")
-            f.write(f"{info['description']}\n\n")
-            f.write("**Recommended annotators**:\n")
-            for ann_name in info['recommended_annotators']:
-                f.write(f"- `{ann_name}`\n")
-            f.write("\n")
-
-        f.write("## Analysis Type Recommendations\n\n")
-        for analysis_type, info in dictionary['recommendations']['analysis_types'].items():
-            f.write(f"### {analysis_type.replace('_', ' ').title()}\n")
-            f.write(f"{info['description']}\n\n")
-            f.write("**Recommended annotators**:\n")
-            for ann_name in info['recommended_annotators']:
-                f.write(f"- `{ann_name}`\n")
-            f.write("\n")
+        f.write(''.join(parts))
 
     print(f"✅ Markdown reference saved to: {md_path}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Build OpenCRAVAT annotator dictionary")
+    parser.add_argument("--relevant-only", action="store_true",
+                        help="only parse YAML for annotators matching categorization/recommendation "
+                             "keywords; others are emitted as unvalidated stubs and lose tag-based categories")
+    args = parser.parse_args()
+    main(relevant_only=args.relevant_only)
 